@@ -1,3 +1,5 @@
+import torch
+
 from mushroom_rl.algorithms import Agent
 
 
@@ -69,14 +71,25 @@ class DeepAC(Agent):
 
     @staticmethod
     def _init_target(online, target):
-        for i in range(len(target)):
-            target[i].set_weights(online[i].get_weights())
+        with torch.no_grad():
+            for i in range(len(target)):
+                for tp, op in zip(target[i].network.parameters(),
+                                  online[i].network.parameters()):
+                    tp.copy_(op)
 
     def _update_target(self, online, target):
-        for i in range(len(target)):
-            weights = self._tau * online[i].get_weights()
-            weights += (1 - self._tau) * target[i].get_weights()
-            target[i].set_weights(weights)
+        with torch.no_grad():
+            for i in range(len(target)):
+                online_params = list(online[i].network.parameters())
+                target_params = list(target[i].network.parameters())
+
+                if hasattr(torch, '_foreach_mul_'):
+                    torch._foreach_mul_(target_params, 1 - self._tau)
+                    torch._foreach_add_(target_params, online_params,
+                                        alpha=self._tau)
+                else:
+                    for tp, op in zip(target_params, online_params):
+                        tp.mul_(1 - self._tau).add_(op, alpha=self._tau)
 
     def _post_load(self):
         raise NotImplementedError('DeepAC is an abstract class. Subclasses need'
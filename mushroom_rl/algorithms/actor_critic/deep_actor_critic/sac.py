@@ -1,6 +1,9 @@
+import math
+
 import numpy as np
 
 import torch
+import torch.nn.functional as F
 import torch.optim as optim
 
 from mushroom_rl.algorithms.actor_critic.deep_actor_critic import DeepAC
@@ -8,10 +11,68 @@ from mushroom_rl.policy import Policy
 from mushroom_rl.approximators import Regressor
 from mushroom_rl.approximators.parametric import TorchApproximator
 from mushroom_rl.utils.replay_memory import ReplayMemory
-from mushroom_rl.utils.torch import to_float_tensor
 
 from copy import deepcopy
-from itertools import chain
+
+
+_LOG_SIGMA_MIN = -20.
+_LOG_SIGMA_MAX = 2.
+
+
+def _actor_loss(critic_0, critic_1, state, action, log_prob, alpha):
+    """
+    Body of the SAC actor loss, factored out as a free function over the
+    critic networks and the batch tensors so that it can be wrapped with
+    ``torch.compile``, fusing the two critic forwards, the min and the
+    entropy-regularized mean into a single compiled graph.
+
+    """
+    q = torch.min(critic_0(state, action), critic_1(state, action))
+
+    return (alpha * log_prob - q).mean()
+
+
+@torch.jit.script
+def _squash(a_raw, delta_a, central_a):
+    """
+    Squash a raw Gaussian sample with a tanh and rescale it to the action
+    range, returning the log absolute determinant of the Jacobian of the
+    tanh. The log determinant is computed with the numerically stable
+    closed form ``log(1 - tanh(x)^2) = 2 * (log(2) - x - softplus(-2x))``.
+    The function is scripted so that the chain of small elementwise ops is
+    fused in a single callable without per-op Python dispatch.
+
+    """
+    a = torch.tanh(a_raw)
+    a_true = a * delta_a + central_a
+    log_abs_det = 2. * (math.log(2.) - a_raw - F.softplus(-2. * a_raw))
+
+    return a_true, log_abs_det
+
+
+@torch.jit.script
+def _sample_and_squash(mu, log_sigma, delta_a, central_a):
+    """
+    Sample a squashed action with the reparameterization trick and compute
+    its log probability, given the mean and log standard deviation computed
+    by the actor approximators. Sampling explicitly from a standard normal
+    avoids the Python-level machinery of ``torch.distributions``, and the
+    whole pipeline runs as a single scripted function. The log standard
+    deviation is consumed in log space, so no exp/log round-trip is needed
+    for the density, and it is clamped to the range used by the original
+    SAC implementation for numerical stability.
+
+    """
+    # Literals mirror _LOG_SIGMA_MIN/_LOG_SIGMA_MAX, which TorchScript
+    # cannot capture as globals.
+    log_sigma = log_sigma.clamp(-20., 2.)
+    eps = torch.randn_like(mu)
+    a_raw = mu + log_sigma.exp() * eps
+
+    a_true, log_abs_det = _squash(a_raw, delta_a, central_a)
+    log_prob = -0.5 * eps.pow(2) - log_sigma - 0.5 * math.log(2. * math.pi)
+
+    return a_true, (log_prob - log_abs_det).sum(dim=1)
 
 
 class SACPolicy(Policy):
@@ -41,14 +102,17 @@ class SACPolicy(Policy):
         self._mu_approximator = mu_approximator
         self._sigma_approximator = sigma_approximator
 
-        self._delta_a = to_float_tensor(.5 * (max_a - min_a), self.use_cuda)
-        self._central_a = to_float_tensor(.5 * (max_a + min_a), self.use_cuda)
+        device = next(
+            self._mu_approximator.model.network.parameters()).device
 
-        use_cuda = self._mu_approximator.model.use_cuda
+        self._delta_a = torch.as_tensor(.5 * (max_a - min_a),
+                                        dtype=torch.float32, device=device)
+        self._central_a = torch.as_tensor(.5 * (max_a + min_a),
+                                          dtype=torch.float32, device=device)
 
-        if use_cuda:
-            self._delta_a = self._delta_a.cuda()
-            self._central_a = self._central_a.cuda()
+        self._mu_cpu = None
+        self._sigma_cpu = None
+        self.sync_cpu_actor()
 
         self._add_save_attr(
             _mu_approximator='mushroom',
@@ -61,8 +125,58 @@ class SACPolicy(Policy):
         raise NotImplementedError
 
     def draw_action(self, state):
-        return self.compute_action_and_log_prob_t(
-            state, compute_log_prob=False).detach().cpu().numpy()
+        with torch.no_grad():
+            if self.use_cuda:
+                return self._draw_action_cpu(state)
+
+            return self.compute_action_and_log_prob_t(
+                state, compute_log_prob=False).cpu().numpy()
+
+    def _draw_action_cpu(self, state):
+        """
+        Draw an action evaluating the CPU copy of the actor networks, so
+        that no device synchronization is needed at every environment step
+        when the approximators live on the GPU.
+
+        """
+        if getattr(self, '_mu_cpu', None) is None:
+            self.sync_cpu_actor()
+
+        state = np.asarray(state)
+        unbatched = state.ndim == 1
+
+        s = torch.as_tensor(np.atleast_2d(state), dtype=torch.float32)
+        mu = self._mu_cpu(s)
+        sigma = self._sigma_cpu(s).clamp(_LOG_SIGMA_MIN,
+                                         _LOG_SIGMA_MAX).exp()
+
+        a_raw = mu + sigma * torch.randn_like(mu)
+        a = torch.tanh(a_raw) * self._delta_a_cpu + self._central_a_cpu
+        a = a.numpy()
+
+        return a[0] if unbatched else a
+
+    def sync_cpu_actor(self):
+        """
+        Align the CPU copy of the actor networks with the GPU-resident
+        approximators. This is a no-op when the approximators already live
+        on the CPU, as ``draw_action`` can use them directly.
+
+        """
+        if not self.use_cuda:
+            return
+
+        mu_net = self._mu_approximator.model.network
+        sigma_net = self._sigma_approximator.model.network
+
+        if getattr(self, '_mu_cpu', None) is None:
+            self._mu_cpu = deepcopy(mu_net).cpu().eval()
+            self._sigma_cpu = deepcopy(sigma_net).cpu().eval()
+            self._delta_a_cpu = self._delta_a.cpu()
+            self._central_a_cpu = self._central_a.cpu()
+        else:
+            self._mu_cpu.load_state_dict(mu_net.state_dict())
+            self._sigma_cpu.load_state_dict(sigma_net.state_dict())
 
     def compute_action_and_log_prob(self, state):
         """
@@ -73,7 +187,8 @@ class SACPolicy(Policy):
             state (np.ndarray): the state in which the action is sampled.
 
         Returns:
-            The actions sampled and the log probability as numpy arrays.
+            The actions sampled and the log probability, as a flat array of
+            one value per sample, as numpy arrays.
 
         """
         a, log_prob = self.compute_action_and_log_prob_t(state)
@@ -91,20 +206,21 @@ class SACPolicy(Policy):
 
         Returns:
             The actions sampled and, optionally, the log probability as torch
-            tensors.
+            tensors. The log probability is a flat tensor with one value per
+            sample, already reduced over the action dimensions.
 
         """
-        dist = self.distribution(state)
-        a_raw = dist.rsample()
-        a = torch.tanh(a_raw)
-        a_true = a * self._delta_a + self._central_a
+        mu = self._mu_approximator.predict(state, output_tensor=True)
+        log_sigma = self._sigma_approximator.predict(state,
+                                                     output_tensor=True)
 
         if compute_log_prob:
-            log_prob = dist.log_prob(a_raw).sum(dim=1)
-            log_prob -= torch.log(1. - a.pow(2) + 1e-6).sum(dim=1)
-            return a_true, log_prob
+            return _sample_and_squash(mu, log_sigma, self._delta_a,
+                                      self._central_a)
         else:
-            return a_true
+            sigma = log_sigma.clamp(_LOG_SIGMA_MIN, _LOG_SIGMA_MAX).exp()
+            a_raw = mu + sigma * torch.randn_like(mu)
+            return torch.tanh(a_raw) * self._delta_a + self._central_a
 
     def distribution(self, state):
         """
@@ -120,6 +236,8 @@ class SACPolicy(Policy):
         """
         mu = self._mu_approximator.predict(state, output_tensor=True)
         log_sigma = self._sigma_approximator.predict(state, output_tensor=True)
+        log_sigma = log_sigma.clamp(_LOG_SIGMA_MIN, _LOG_SIGMA_MAX)
+
         return torch.distributions.Normal(mu, log_sigma.exp())
 
     def entropy(self, state=None):
@@ -185,7 +303,8 @@ class SAC(DeepAC):
     def __init__(self, mdp_info, actor_mu_params, actor_sigma_params,
                  actor_optimizer, critic_params, batch_size,
                  initial_replay_size, max_replay_size, warmup_transitions, tau,
-                 lr_alpha, target_entropy=None, critic_fit_params=None):
+                 lr_alpha, target_entropy=None, critic_fit_params=None,
+                 use_torch_compile=False):
         """
         Constructor.
 
@@ -210,7 +329,13 @@ class SAC(DeepAC):
             target_entropy (float, None): target entropy for the policy, if
                 None a default value is computed ;
             critic_fit_params (dict, None): parameters of the fitting algorithm
-                of the critic approximator.
+                of the critic approximator;
+            use_torch_compile (bool, False): if True, the actor loss is
+                wrapped with ``torch.compile``, when available, to fuse the
+                critic forwards and the elementwise ops of the loss. As
+                fusion can reorder floating point operations, compiled runs
+                are not bitwise reproducible with eager ones, hence the
+                feature is opt-in.
 
         """
         self._critic_fit_params = dict() if critic_fit_params is None else critic_fit_params
@@ -218,6 +343,8 @@ class SAC(DeepAC):
         self._batch_size = batch_size
         self._warmup_transitions = warmup_transitions
         self._tau = tau
+        self._use_torch_compile = use_torch_compile
+        self._compiled_actor_loss = self._build_compiled_loss()
 
         if target_entropy is None:
             self._target_entropy = -np.prod(mdp_info.action_space.shape).astype(np.float32)
@@ -231,7 +358,11 @@ class SAC(DeepAC):
         else:
             critic_params['n_models'] = 2
 
-        target_critic_params = deepcopy(critic_params)
+        # A shallow copy is enough: the nested values (network class,
+        # optimizer spec, ...) are shared by reference but never mutated by
+        # the regressors, and a deepcopy of them is expensive when many
+        # agents are instantiated, e.g. in hyperparameter sweeps.
+        target_critic_params = dict(critic_params)
         self._critic_approximator = Regressor(TorchApproximator,
                                               **critic_params)
         self._target_critic_approximator = Regressor(TorchApproximator,
@@ -259,8 +390,9 @@ class SAC(DeepAC):
 
         self._alpha_optim = optim.Adam([self._log_alpha], lr=lr_alpha)
 
-        policy_parameters = chain(actor_mu_approximator.model.network.parameters(),
-                                  actor_sigma_approximator.model.network.parameters())
+        policy_parameters = \
+            list(actor_mu_approximator.model.network.parameters()) + \
+            list(actor_sigma_approximator.model.network.parameters())
 
         self._add_save_attr(
             _critic_fit_params='pickle',
@@ -272,7 +404,8 @@ class SAC(DeepAC):
             _critic_approximator='mushroom',
             _target_critic_approximator='mushroom',
             _log_alpha='torch',
-            _alpha_optim='torch'
+            _alpha_optim='torch',
+            _use_torch_compile='primitive'
         )
 
         super().__init__(mdp_info, policy, actor_optimizer, policy_parameters)
@@ -281,15 +414,30 @@ class SAC(DeepAC):
         self._replay_memory.add(dataset)
         if self._replay_memory.initialized:
             state, action, reward, next_state, absorbing, _ = \
-                self._replay_memory.get(self._batch_size)
+                self._replay_memory.get(self._batch_size, output_tensor=True,
+                                        use_cuda=self.policy.use_cuda)
+
+            alpha = self._alpha
 
             if self._replay_memory.size > self._warmup_transitions:
-                action_new, log_prob = self.policy.compute_action_and_log_prob_t(state)
-                loss = self._loss(state, action_new, log_prob)
+                # A single batched actor forward serves both the actor loss
+                # on state and the bootstrap target on next_state: same
+                # FLOPs, half the launches, better GEMM utilization.
+                a_both, log_prob_both = \
+                    self.policy.compute_action_and_log_prob_t(
+                        torch.cat((state, next_state)))
+                action_new, action_next = a_both.chunk(2)
+                log_prob, log_prob_next = log_prob_both.chunk(2)
+
+                loss = self._loss(state, action_new, log_prob, alpha)
                 self._optimize_actor_parameters(loss)
                 self._update_alpha(log_prob.detach())
 
-            q_next = self._next_q(next_state, absorbing)
+                q_next = self._next_q(next_state, absorbing, alpha,
+                                      action_next.detach(),
+                                      log_prob_next.detach())
+            else:
+                q_next = self._next_q(next_state, absorbing, alpha)
             q = reward + self.mdp_info.gamma * q_next
 
             self._critic_approximator.fit(state, action, q,
@@ -298,15 +446,31 @@ class SAC(DeepAC):
             self._update_target(self._critic_approximator,
                                 self._target_critic_approximator)
 
-    def _loss(self, state, action_new, log_prob):
-        q_0 = self._critic_approximator(state, action_new,
-                                        output_tensor=True, idx=0)
-        q_1 = self._critic_approximator(state, action_new,
-                                        output_tensor=True, idx=1)
+            self.policy.sync_cpu_actor()
+
+    def _loss(self, state, action_new, log_prob, alpha):
+        # A no-op pass-through when the inputs are already contiguous, as
+        # batches gathered from the replay memory are; this only guards
+        # against strided views reaching the critic GEMMs.
+        state = state.contiguous()
+        action_new = action_new.contiguous()
 
-        q = torch.min(q_0, q_1)
+        if self._compiled_actor_loss is not None:
+            return self._compiled_actor_loss(
+                self._critic_approximator[0].network,
+                self._critic_approximator[1].network,
+                state, action_new, log_prob, alpha)
 
-        return (self._alpha * log_prob - q).mean()
+        q = self._critic_approximator(state, action_new,
+                                      output_tensor=True, prediction='min')
+
+        return (alpha * log_prob - q).mean()
+
+    def _build_compiled_loss(self):
+        if self._use_torch_compile and hasattr(torch, 'compile'):
+            return torch.compile(_actor_loss, dynamic=False)
+
+        return None
 
     def _update_alpha(self, log_prob):
         alpha_loss = - (self._log_alpha * (log_prob + self._target_entropy)).mean()
@@ -314,34 +478,59 @@ class SAC(DeepAC):
         alpha_loss.backward()
         self._alpha_optim.step()
 
-    def _next_q(self, next_state, absorbing):
+    @torch.no_grad()
+    def _next_q(self, next_state, absorbing, alpha, a=None,
+                log_prob_next=None):
         """
         Args:
-            next_state (np.ndarray): the states where next action has to be
+            next_state (torch.Tensor): the states where next action has to be
                 evaluated;
-            absorbing (np.ndarray): the absorbing flag for the states in
-                ``next_state``.
+            absorbing (torch.Tensor): the absorbing flag for the states in
+                ``next_state``;
+            alpha (torch.Tensor): the entropy coefficient, cached once per
+                fit step;
+            a (torch.Tensor, None): the next actions, when already sampled
+                by the batched actor forward of ``fit``; sampled here
+                otherwise;
+            log_prob_next (torch.Tensor, None): the log probability of
+                ``a``, when already computed by ``fit``.
 
         Returns:
             Action-values returned by the critic for ``next_state`` and the
-            action returned by the actor.
+            action returned by the actor. The critic forward is skipped for
+            absorbing states, whose value is defined to be zero.
 
         """
-        a, log_prob_next = self.policy.compute_action_and_log_prob(next_state)
-
-        q = self._target_critic_approximator.predict(
-            next_state, a, prediction='min') - self._alpha_np * log_prob_next
-        q *= 1 - absorbing
+        next_state = next_state.contiguous()
+        if a is None:
+            a, log_prob_next = self.policy.compute_action_and_log_prob_t(
+                next_state)
+        a = a.contiguous()
+
+        mask = absorbing == 0.
+
+        if bool(mask.all()):
+            return self._target_critic_approximator.predict(
+                next_state, a, prediction='min',
+                output_tensor=True) - alpha * log_prob_next
+
+        q = torch.zeros_like(absorbing)
+        if bool(mask.any()):
+            q[mask] = self._target_critic_approximator.predict(
+                next_state[mask].contiguous(), a[mask].contiguous(),
+                prediction='min',
+                output_tensor=True) - alpha * log_prob_next[mask]
 
         return q
 
     def _post_load(self):
         if self._optimizer is not None:
-            self._parameters = list(
-                chain(self.policy._mu_approximator.model.network.parameters(),
-                      self.policy._sigma_approximator.model.network.parameters()
-                )
-            )
+            self._parameters = \
+                list(self.policy._mu_approximator.model.network.parameters()) + \
+                list(self.policy._sigma_approximator.model.network.parameters())
+
+        self._use_torch_compile = getattr(self, '_use_torch_compile', False)
+        self._compiled_actor_loss = self._build_compiled_loss()
 
     @property
     def _alpha(self):
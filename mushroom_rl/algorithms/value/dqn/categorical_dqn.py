@@ -118,8 +118,8 @@ class CategoricalDQN(DQN):
                                                             self._v_max)
 
             b = (bell_a - self._v_min) / self._delta
-            l = np.floor(b).astype(np.int)
-            u = np.ceil(b).astype(np.int)
+            l = np.floor(b).astype(int)
+            u = np.ceil(b).astype(int)
 
             m = np.zeros((self._batch_size, self._n_atoms))
             for i in range(self._n_atoms):
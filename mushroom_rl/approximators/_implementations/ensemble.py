@@ -1,4 +1,5 @@
 import numpy as np
+import torch
 from sklearn.exceptions import NotFittedError
 
 from mushroom_rl.core import Serializable
@@ -78,16 +79,29 @@ class Ensemble(Serializable):
             if len(predictions) == 0:
                 raise NotFittedError
 
-            if prediction == 'mean':
-                results = np.mean(predictions, axis=0)
-            elif prediction == 'sum':
-                results = np.sum(predictions, axis=0)
-            elif prediction == 'min':
-                results = np.amin(predictions, axis=0)
+            if isinstance(predictions[0], torch.Tensor):
+                predictions = torch.stack(predictions)
+                if prediction == 'mean':
+                    results = predictions.mean(0)
+                elif prediction == 'sum':
+                    results = predictions.sum(0)
+                elif prediction == 'min':
+                    results = predictions.min(0).values
+                else:
+                    raise ValueError
+                if compute_variance:
+                    results = [results, predictions.var(0)]
             else:
-                raise ValueError
-            if compute_variance:
-                results = [results, np.var(predictions, ddof=1, axis=0)]
+                if prediction == 'mean':
+                    results = np.mean(predictions, axis=0)
+                elif prediction == 'sum':
+                    results = np.sum(predictions, axis=0)
+                elif prediction == 'min':
+                    results = np.amin(predictions, axis=0)
+                else:
+                    raise ValueError
+                if compute_variance:
+                    results = [results, np.var(predictions, ddof=1, axis=0)]
         else:
             try:
                 results = self[idx].predict(*z, **predict_params)
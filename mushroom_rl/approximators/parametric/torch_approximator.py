@@ -159,8 +159,7 @@ class TorchApproximator(Serializable):
             use_weights = False
 
         if 0 < validation_split <= 1:
-            train_len = np.ceil(len(args[0]) * validation_split).astype(
-                np.int)
+            train_len = int(np.ceil(len(args[0]) * validation_split))
             train_args = [a[:train_len] for a in args]
             val_args = [a[train_len:] for a in args]
         else:
@@ -238,9 +237,12 @@ class TorchApproximator(Serializable):
             batch = batch[:-1]
 
         if not self._use_cuda:
-            torch_args = [torch.from_numpy(x) for x in batch]
+            torch_args = [torch.from_numpy(x) if isinstance(x, np.ndarray)
+                          else x for x in batch]
         else:
-            torch_args = [torch.from_numpy(x).cuda() for x in batch]
+            torch_args = [torch.from_numpy(x).cuda()
+                          if isinstance(x, np.ndarray) else x.cuda()
+                          for x in batch]
 
         x = torch_args[:-self._n_fit_targets]
 
@@ -1,12 +1,40 @@
 import numpy as np
+import torch
+
 from mushroom_rl.core import Serializable
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _circular_write(buffer, batch, start):
+    """
+    Write ``batch`` into ``buffer`` starting from index ``start``, wrapping
+    around the end of the buffer. The write is two contiguous slice copies,
+    compiled with numba when the package is available.
+
+    """
+    size = min(len(batch), len(buffer) - start)
+    buffer[start:start + size] = batch[:size]
+    if size < len(batch):
+        buffer[:len(batch) - size] = batch[size:]
+
+
+if njit is not None:
+    _circular_write = njit(cache=True)(_circular_write)
+
 
 class ReplayMemory(Serializable):
     """
     This class implements function to manage a replay memory as the one used in
     "Human-Level Control Through Deep Reinforcement Learning" by Mnih V. et al..
 
+    The transitions are stored as a struct-of-arrays of pre-allocated numpy
+    buffers, so that sampling a batch is a single vectorized gather instead of
+    a Python loop over individual transitions.
+
     """
     def __init__(self, initial_size, max_size):
         """
@@ -44,60 +72,138 @@ class ReplayMemory(Serializable):
             dataset (list): list of elements to add to the replay memory.
 
         """
-        for i in range(len(dataset)):
-            self._states[self._idx] = dataset[i][0]
-            self._actions[self._idx] = dataset[i][1]
-            self._rewards[self._idx] = dataset[i][2]
-            self._next_states[self._idx] = dataset[i][3]
-            self._absorbing[self._idx] = dataset[i][4]
-            self._last[self._idx] = dataset[i][5]
+        if self._states is None:
+            self._allocate(dataset[0])
 
-            self._idx += 1
-            if self._idx == self._max_size:
-                self._full = True
-                self._idx = 0
+        n = len(dataset)
+        start = self._idx
+        end = start + n
 
-    def get(self, n_samples):
+        if n > self._max_size:
+            dataset = dataset[-self._max_size:]
+            start = (start + n - self._max_size) % self._max_size
+
+        buffers = (self._states, self._actions, self._rewards,
+                   self._next_states, self._absorbing, self._last)
+        for buffer, column in zip(buffers, zip(*dataset)):
+            self._write(buffer, column, start)
+
+        self._full = self._full or end >= self._max_size
+        self._idx = end % self._max_size
+
+    def get(self, n_samples, output_tensor=False, use_cuda=False):
         """
         Returns the provided number of states from the replay memory.
 
         Args:
-            n_samples (int): the number of samples to return.
+            n_samples (int): the number of samples to return;
+            output_tensor (bool, False): whether to return the batch as
+                float torch tensors, ready to be consumed by a torch
+                approximator, instead of numpy arrays;
+            use_cuda (bool, False): if ``output_tensor`` is True, whether to
+                move the batch to the GPU.
 
         Returns:
             The requested number of samples.
 
         """
-        s = list()
-        a = list()
-        r = list()
-        ss = list()
-        ab = list()
-        last = list()
-        for i in np.random.randint(self.size, size=n_samples):
-            s.append(np.array(self._states[i]))
-            a.append(self._actions[i])
-            r.append(self._rewards[i])
-            ss.append(np.array(self._next_states[i]))
-            ab.append(self._absorbing[i])
-            last.append(self._last[i])
+        idx = np.random.randint(self.size, size=n_samples)
+
+        batch = (self._gather(self._states, idx),
+                 self._gather(self._actions, idx),
+                 self._gather(self._rewards, idx),
+                 self._gather(self._next_states, idx),
+                 self._gather(self._absorbing, idx),
+                 self._gather(self._last, idx))
+
+        if output_tensor:
+            if use_cuda:
+                batch = self._to_cuda(batch)
+            else:
+                batch = tuple(torch.as_tensor(b, dtype=torch.float32)
+                              for b in batch)
 
-        return np.array(s), np.array(a), np.array(r), np.array(ss),\
-            np.array(ab), np.array(last)
+        return batch
 
     def reset(self):
         """
-        Reset the replay memory.
+        Reset the replay memory. The buffers are deallocated and built again
+        at the first call of ``add``, since their shape and dtype depend on
+        the stored transitions.
 
         """
         self._idx = 0
         self._full = False
-        self._states = [None for _ in range(self._max_size)]
-        self._actions = [None for _ in range(self._max_size)]
-        self._rewards = [None for _ in range(self._max_size)]
-        self._next_states = [None for _ in range(self._max_size)]
-        self._absorbing = [None for _ in range(self._max_size)]
-        self._last = [None for _ in range(self._max_size)]
+        self._states = None
+        self._actions = None
+        self._rewards = None
+        self._next_states = None
+        self._absorbing = None
+        self._last = None
+
+    def _allocate(self, transition):
+        state, action, reward, next_state, absorbing, last = transition
+
+        self._states = self._allocate_buffer(state)
+        self._actions = self._allocate_buffer(action)
+        self._rewards = self._allocate_buffer(reward)
+        self._next_states = self._allocate_buffer(next_state)
+        self._absorbing = self._allocate_buffer(absorbing)
+        self._last = self._allocate_buffer(last)
+
+    def _allocate_buffer(self, sample):
+        if isinstance(sample, np.ndarray) and sample.dtype != object:
+            return np.empty((self._max_size,) + sample.shape,
+                            dtype=sample.dtype)
+        elif isinstance(sample, (bool, np.bool_)):
+            return np.empty(self._max_size, dtype=bool)
+        elif np.isscalar(sample):
+            return np.empty(self._max_size)
+        else:
+            return np.empty(self._max_size, dtype=object)
+
+    def _to_cuda(self, batch):
+        """
+        Move a sampled batch to the GPU through pinned-memory staging
+        buffers and asynchronous transfers, so the copies can overlap with
+        the computation already enqueued on the stream. The staging buffers
+        are reused across calls; an event guards them against being
+        overwritten while a previous transfer is still in flight.
+
+        """
+        staging = getattr(self, '_staging', None)
+        if staging is None or \
+                any(s.shape != b.shape for s, b in zip(staging, batch)):
+            staging = [torch.empty(b.shape, dtype=torch.float32,
+                                   pin_memory=True) for b in batch]
+            self._staging = staging
+            self._staging_event = torch.cuda.Event()
+        else:
+            self._staging_event.synchronize()
+
+        out = list()
+        for s, b in zip(staging, batch):
+            s.copy_(torch.from_numpy(b))
+            out.append(s.to('cuda', non_blocking=True))
+        self._staging_event.record()
+
+        return tuple(out)
+
+    def _write(self, buffer, column, start):
+        if buffer.dtype == object:
+            for j, value in enumerate(column):
+                buffer[(start + j) % self._max_size] = value
+        else:
+            _circular_write(buffer, np.asarray(column, dtype=buffer.dtype),
+                            start)
+
+    @staticmethod
+    def _gather(buffer, idx):
+        batch = buffer[idx]
+        if buffer.dtype == object:
+            batch = np.stack([np.asarray(b) for b in batch])
+
+        return batch
 
     @property
     def initialized(self):
@@ -312,7 +418,7 @@ class PrioritizedReplayMemory(Serializable):
         absorbing = [None for _ in range(n_samples)]
         last = [None for _ in range(n_samples)]
 
-        idxs = np.zeros(n_samples, dtype=np.int)
+        idxs = np.zeros(n_samples, dtype=int)
         priorities = np.zeros(n_samples)
 
         total_p = self._tree.total_p